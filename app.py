@@ -4,8 +4,8 @@ from typing import List, Dict, Any
 
 from rag.config import ensure_data_dir
 from rag.ingest import ingest_documents
-from rag.llm import generate_answer
 from rag.retriever import Retriever
+from rag.singleflight import coalesced_retrieve, coalesced_stream_answer
 
 # Page config
 st.set_page_config(
@@ -111,7 +111,7 @@ for msg in st.session_state.messages:
                     st.markdown(f"""
                     <div class="context-chunk">
                         <div style="display: flex; justify-content: space-between; margin-bottom: 0.5rem;">
-                            <span class="source-badge">📄 {ctx.get('source', 'Unknown')}</span>
+                            <span class="source-badge">📄 {ctx.get('source', 'Unknown')}{f" · p. {ctx['page']}" if ctx.get('page') is not None else ''}</span>
                             <span class="source-badge">Score: {ctx.get('score', 0):.3f}</span>
                         </div>
                         <div style="font-size: 0.9rem;">{ctx.get('text', '')}</div>
@@ -130,41 +130,41 @@ if 'current_question' in st.session_state:
         st.markdown(question)
     
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            try:
-                # Retrieve contexts
-                contexts = st.session_state.retriever.retrieve(question)
-                
-                # Generate answer
-                answer = generate_answer(question, contexts, mode=mode)
-                
-                # Display answer
-                st.markdown(answer)
-                
-                # Save to history
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": answer,
-                    "contexts": contexts
-                })
-                
-                # Show contexts
-                with st.expander("📄 View Retrieved Context"):
-                    for i, ctx in enumerate(contexts, 1):
-                        st.markdown(f"""
-                        <div class="context-chunk">
-                            <div style="display: flex; justify-content: space-between; margin-bottom: 0.5rem;">
-                                <span class="source-badge">📄 {ctx.get('source', 'Unknown')}</span>
-                                <span class="source-badge">Score: {ctx.get('score', 0):.3f}</span>
-                            </div>
-                            <div style="font-size: 0.9rem;">{ctx.get('text', '')}</div>
+        try:
+            # Retrieve contexts (identical in-flight questions share one search)
+            retriever = st.session_state.retriever
+            with st.spinner("Thinking..."):
+                contexts = coalesced_retrieve(retriever, question)
+            
+            # Stream the answer as it is generated
+            answer = st.write_stream(
+                coalesced_stream_answer(question, contexts, mode=mode, index_version=retriever.index_version)
+            )
+        
+            # Save to history
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": answer,
+                "contexts": contexts
+            })
+            
+            # Show contexts
+            with st.expander("📄 View Retrieved Context"):
+                for i, ctx in enumerate(contexts, 1):
+                    st.markdown(f"""
+                    <div class="context-chunk">
+                        <div style="display: flex; justify-content: space-between; margin-bottom: 0.5rem;">
+                            <span class="source-badge">📄 {ctx.get('source', 'Unknown')}{f" · p. {ctx['page']}" if ctx.get('page') is not None else ''}</span>
+                            <span class="source-badge">Score: {ctx.get('score', 0):.3f}</span>
                         </div>
-                        """, unsafe_allow_html=True)
-                
-            except Exception as e:
-                error_msg = f"Error: {str(e)}"
-                st.error(error_msg)
-                st.session_state.messages.append({"role": "assistant", "content": error_msg})
+                        <div style="font-size: 0.9rem;">{ctx.get('text', '')}</div>
+                    </div>
+                    """, unsafe_allow_html=True)
+            
+        except Exception as e:
+            error_msg = f"Error: {str(e)}"
+            st.error(error_msg)
+            st.session_state.messages.append({"role": "assistant", "content": error_msg})
     
     st.rerun()
 
@@ -178,41 +178,41 @@ if prompt := st.chat_input("Ask a question..."):
     
     # Generate response
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            try:
-                # Retrieve contexts
-                contexts = st.session_state.retriever.retrieve(prompt)
-                
-                # Generate answer
-                answer = generate_answer(prompt, contexts, mode=mode)
-                
-                # Display answer
-                st.markdown(answer)
-                
-                # Save to history
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": answer,
-                    "contexts": contexts
-                })
-                
-                # Show contexts
-                with st.expander("📄 View Retrieved Context"):
-                    for i, ctx in enumerate(contexts, 1):
-                        st.markdown(f"""
-                        <div class="context-chunk">
-                            <div style="display: flex; justify-content: space-between; margin-bottom: 0.5rem;">
-                                <span class="source-badge">📄 {ctx.get('source', 'Unknown')}</span>
-                                <span class="source-badge">Score: {ctx.get('score', 0):.3f}</span>
-                            </div>
-                            <div style="font-size: 0.9rem;">{ctx.get('text', '')}</div>
+        try:
+            # Retrieve contexts (identical in-flight questions share one search)
+            retriever = st.session_state.retriever
+            with st.spinner("Thinking..."):
+                contexts = coalesced_retrieve(retriever, prompt)
+            
+            # Stream the answer as it is generated
+            answer = st.write_stream(
+                coalesced_stream_answer(prompt, contexts, mode=mode, index_version=retriever.index_version)
+            )
+        
+            # Save to history
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": answer,
+                "contexts": contexts
+            })
+            
+            # Show contexts
+            with st.expander("📄 View Retrieved Context"):
+                for i, ctx in enumerate(contexts, 1):
+                    st.markdown(f"""
+                    <div class="context-chunk">
+                        <div style="display: flex; justify-content: space-between; margin-bottom: 0.5rem;">
+                            <span class="source-badge">📄 {ctx.get('source', 'Unknown')}{f" · p. {ctx['page']}" if ctx.get('page') is not None else ''}</span>
+                            <span class="source-badge">Score: {ctx.get('score', 0):.3f}</span>
                         </div>
-                        """, unsafe_allow_html=True)
-                
-            except Exception as e:
-                error_msg = f"Error: {str(e)}"
-                st.error(error_msg)
-                st.session_state.messages.append({"role": "assistant", "content": error_msg})
+                        <div style="font-size: 0.9rem;">{ctx.get('text', '')}</div>
+                    </div>
+                    """, unsafe_allow_html=True)
+            
+        except Exception as e:
+            error_msg = f"Error: {str(e)}"
+            st.error(error_msg)
+            st.session_state.messages.append({"role": "assistant", "content": error_msg})
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,191 @@
+"""
+Provider Router Check
+
+Runs the LLM provider router against local stub endpoints (no API keys or
+network needed). Checks:
+- hedging: a slow primary gets a hedged request and the fast one wins
+- failover: a 429 from the primary falls over to the next provider
+- circuit breaker: opens after repeated failures, half-opens after the cooldown
+- streaming: hedging on time to first token, and a forced request when every breaker is open
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+
+class StubProvider:
+    # OpenAI-style chat endpoint whose delay / status can be changed between checks
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.delay = 0.0
+        self.status = 200
+        self.hits = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.0"
+
+            def do_POST(self) -> None:
+                stub.hits += 1
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                time.sleep(stub.delay)
+                self.send_response(stub.status)
+                self.end_headers()
+                if not request.get("stream"):
+                    body = {"choices": [{"message": {"content": f"answer from {stub.name}"}}]}
+                    self.wfile.write(json.dumps(body).encode())
+                    return
+                try:
+                    for token in ["answer", " from", f" {stub.name}"]:
+                        event = {"choices": [{"delta": {"content": token}}]}
+                        self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+                        self.wfile.flush()
+                    self.wfile.write(b"data: [DONE]\n\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the router closed a losing / failed stream early
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def reset(self, delay: float = 0.0, status: int = 200) -> None:
+        self.delay, self.status, self.hits = delay, status, 0
+
+
+groq = StubProvider("groq")
+openrouter = StubProvider("openrouter")
+
+# must be set before rag.config is imported
+os.environ.update(
+    GROQ_API_KEY="stub",
+    OPENROUTER_API_KEY="stub",
+    GROQ_BASE_URL=groq.url,
+    OPENROUTER_BASE_URL=openrouter.url,
+    USE_OLLAMA="false",
+    HEDGE_DEFAULT_DELAY="0.2",
+    HEDGE_MIN_DELAY="0.1",
+    BREAKER_FAILURES="2",
+    BREAKER_COOLDOWN="0.5",
+)
+
+from rag.llm import STREAMERS, request_groq, request_openrouter  # noqa: E402
+from rag.router import ProviderError, ProviderRouter  # noqa: E402
+
+
+def new_router() -> ProviderRouter:
+    return ProviderRouter([("groq", request_groq), ("openrouter", request_openrouter)])
+
+
+def check_hedge() -> Dict[str, Any]:
+    groq.reset(delay=1.0)
+    openrouter.reset(delay=0.05)
+    start = time.monotonic()
+    answer = new_router().complete("q")
+    elapsed = time.monotonic() - start
+    assert answer == "answer from openrouter", answer
+    assert groq.hits == 1 and openrouter.hits == 1
+    # hedge fires after HEDGE_DEFAULT_DELAY, well before the slow primary answers
+    assert elapsed < 0.6, elapsed
+    return {"elapsed": round(elapsed, 3)}
+
+
+def check_failover() -> Dict[str, Any]:
+    groq.reset(status=429)
+    openrouter.reset()
+    router = new_router()
+    answer = router.complete("q")
+    assert answer == "answer from openrouter", answer
+    assert groq.hits == 1
+    assert router.stats["groq"].error_rate() == 1.0
+    return {"groq_error_rate": router.stats["groq"].error_rate()}
+
+
+def check_breaker() -> Dict[str, Any]:
+    groq.reset(status=429)
+    openrouter.reset()
+    # openrouter as a fallback, so ranking can't move groq out of the way by itself
+    router = ProviderRouter([("groq", request_groq)], fallbacks=[("openrouter", request_openrouter)])
+    for _ in range(2):
+        router.complete("q")
+    assert router.stats["groq"].opened_at is not None, "breaker should be open"
+
+    hits = groq.hits
+    router.complete("q")
+    assert groq.hits == hits, "open breaker should skip groq"
+
+    # after the cooldown a single trial goes through and closes the breaker on success
+    time.sleep(0.6)
+    groq.reset()
+    openrouter.reset(status=500)
+    answer = router.complete("q")
+    assert answer == "answer from groq", answer
+    assert router.stats["groq"].opened_at is None, "breaker should be closed again"
+    return {"closed_after_trial": True}
+
+
+def check_stream_hedge() -> Dict[str, Any]:
+    groq.reset(delay=1.0)
+    openrouter.reset(delay=0.05)
+    router = new_router()
+    start = time.monotonic()
+    answer = "".join(router.stream("q", STREAMERS))
+    elapsed = time.monotonic() - start
+    assert answer == "answer from openrouter", answer
+    assert elapsed < 0.6, elapsed
+    # time to first token goes to its own window, not the completion latencies
+    stats = router.stats["openrouter"]
+    assert len(stats.first_token) == 1 and not stats.latencies
+    return {"elapsed": round(elapsed, 3)}
+
+
+def check_stream_breaker_open() -> Dict[str, Any]:
+    groq.reset(status=429)
+    router = ProviderRouter([("groq", request_groq)])
+    for _ in range(2):
+        try:
+            "".join(router.stream("q", STREAMERS))
+        except ProviderError:
+            pass
+    assert router.stats["groq"].opened_at is not None, "breaker should be open"
+
+    hits = groq.hits
+    try:
+        "".join(router.stream("q", STREAMERS))
+        raise AssertionError("expected an error")
+    except ProviderError as e:
+        message = str(e)
+    assert groq.hits == hits + 1, "a request should still be sent when every breaker is open"
+    assert "None" not in message, message
+    return {"error": message}
+
+
+CHECKS = [check_hedge, check_failover, check_breaker, check_stream_hedge, check_stream_breaker_open]
+
+
+def main() -> None:
+    failed = 0
+    for check in CHECKS:
+        try:
+            info = check()
+            print(f"PASS {check.__name__} {info}")
+        except AssertionError as e:
+            failed += 1
+            print(f"FAIL {check.__name__}: {e}")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Offline bulk question answering.
+
+Streams questions from a JSONL file, retrieves contexts in large batches
+(one encode + one FAISS search per batch), calls the LLM concurrently under
+a rate limit on provider requests and appends answers to an output JSONL as
+they complete. Hedging is off by default so every question costs one call.
+The output file doubles as the checkpoint: re-running the same command
+skips every id already written.
+
+    python -m rag.bulk questions.jsonl answers.jsonl --concurrency 8 --rate 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Set, Tuple
+
+from .llm import build_router, request_answer
+from .retriever import Retriever
+from .router import ProviderRouter
+
+
+class RateLimiter:
+    # Token bucket shared by the worker threads; rate <= 0 disables it
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                sleep_for = (1 - self.tokens) / self.rate
+            time.sleep(sleep_for)
+
+
+def load_checkpoint(output_path: Path) -> Set[str]:
+    # ids already answered, read line by line. A last line cut off by a crash is
+    # truncated away so appending doesn't glue the next record onto it; other
+    # unreadable lines are skipped (and those questions answered again).
+    done: Set[str] = set()
+    if not output_path.exists():
+        return done
+    bad = 0
+    with output_path.open("rb+") as f:
+        end_of_last_line = 0
+        for raw in iter(f.readline, b""):
+            if not raw.endswith(b"\n"):
+                f.truncate(end_of_last_line)
+                print(f"Dropped an incomplete last line from {output_path}")
+                break
+            end_of_last_line += len(raw)
+            if not raw.strip():
+                continue
+            try:
+                done.add(str(json.loads(raw)["id"]))
+            except (ValueError, KeyError, TypeError):
+                bad += 1
+    if bad:
+        print(f"Skipped {bad} unreadable lines in {output_path}")
+    return done
+
+
+def iter_questions(
+    input_path: Path,
+    question_field: str,
+    id_field: str,
+    on_error: Callable[[int, str], None] | None = None,
+) -> Iterator[Tuple[str, str]]:
+    # (id, question) pairs; the line number is the id when the record has none.
+    # Unreadable lines are passed to on_error(line number, error) and skipped,
+    # so one bad record can't stop every rerun at the same place.
+    with input_path.open("r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("expected a JSON object")
+                item = str(record.get(id_field, line_no)), record[question_field]
+            except (ValueError, KeyError) as e:
+                if on_error is None:
+                    raise
+                on_error(line_no, f"{type(e).__name__}: {e}")
+                continue
+            yield item
+
+
+def iter_batches(items: Iterator[Tuple[str, str]], size: int) -> Iterator[List[Tuple[str, str]]]:
+    batch: List[Tuple[str, str]] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _answer(
+    limiter: RateLimiter,
+    router: ProviderRouter | None,
+    question: str,
+    contexts: List[Dict[str, Any]],
+    mode: str,
+) -> str:
+    if mode == "offline":
+        limiter.acquire()  # a single Ollama call, no router involved
+    return request_answer(question, contexts, mode=mode, router=router)
+
+
+def run_bulk(
+    input_path: Path,
+    output_path: Path,
+    mode: str = "online",
+    batch_size: int = 256,
+    concurrency: int = 8,
+    rate: float = 5.0,
+    top_k: int = 5,
+    question_field: str = "question",
+    id_field: str = "id",
+    include_contexts: bool = False,
+    report_every: float = 10.0,
+    hedge: bool = False,
+) -> Dict[str, Any]:
+    done = load_checkpoint(output_path)
+    if done:
+        print(f"Resuming: {len(done)} questions already answered in {output_path}")
+
+    retriever = Retriever(top_k=top_k)
+    limiter = RateLimiter(rate, burst=concurrency)
+    # Own router: the limiter sees every provider request (hedges and failovers too),
+    # and hedging is off unless asked for since it can double the cost of a question.
+    router = build_router(hedging=hedge, before_call=limiter.acquire) if mode == "online" else None
+    errors_path = output_path.with_name(output_path.stem + ".errors.jsonl")
+    stats = {"answered": 0, "failed": 0, "skipped": 0, "invalid": 0}
+    start = last_report = time.monotonic()
+
+    def report(final: bool = False) -> None:
+        elapsed = time.monotonic() - start
+        qps = stats["answered"] / elapsed if elapsed > 0 else 0.0
+        label = "Finished" if final else "Progress"
+        print(
+            f"{label}: {stats['answered']} answered, {stats['failed']} failed, "
+            f"{stats['skipped']} skipped, {stats['invalid']} invalid in {elapsed:.1f}s ({qps:.2f} q/s)",
+            flush=True,
+        )
+
+    def write(f, record: Dict[str, Any]) -> None:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())  # a crash never loses an answer we already paid for
+
+    def drain(pending: Dict[Future, Tuple[str, str, List[Dict[str, Any]]]], out_f, err_f, limit: int) -> None:
+        # write finished answers until at most `limit` calls are still in flight
+        nonlocal last_report
+        while len(pending) > limit:
+            finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in finished:
+                qid, question, contexts = pending.pop(future)
+                try:
+                    answer = future.result()
+                except Exception as e:  # noqa: BLE001
+                    # not checkpointed, so the next run retries it
+                    stats["failed"] += 1
+                    write(err_f, {"id": qid, "question": question, "error": str(e)})
+                    continue
+                record: Dict[str, Any] = {
+                    "id": qid,
+                    "question": question,
+                    "answer": answer,
+                    "sources": [
+                        {k: c.get(k) for k in ("source", "page", "chunk_id", "score")} for c in contexts
+                    ],
+                }
+                if include_contexts:
+                    record["contexts"] = contexts
+                write(out_f, record)
+                stats["answered"] += 1
+            if time.monotonic() - last_report >= report_every:
+                last_report = time.monotonic()
+                report()
+
+    def todo(err_f) -> Iterator[Tuple[str, str]]:
+        def bad_line(line_no: int, error: str) -> None:
+            stats["invalid"] += 1
+            write(err_f, {"line": line_no, "error": error})
+
+        for qid, question in iter_questions(input_path, question_field, id_field, on_error=bad_line):
+            if qid in done:
+                stats["skipped"] += 1
+                continue
+            yield qid, question
+
+    pending: Dict[Future, Tuple[str, str, List[Dict[str, Any]]]] = {}
+    with output_path.open("a", encoding="utf-8") as out_f, errors_path.open("w", encoding="utf-8") as err_f, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bulk") as executor:
+        for batch in iter_batches(todo(err_f), batch_size):
+            batch_contexts = retriever.retrieve_batch([q for _, q in batch])
+            for (qid, question), contexts in zip(batch, batch_contexts):
+                # bound the number of queued LLM calls (and the contexts they hold)
+                drain(pending, out_f, err_f, limit=2 * concurrency)
+                future = executor.submit(_answer, limiter, router, question, contexts, mode)
+                pending[future] = (qid, question, contexts)
+        drain(pending, out_f, err_f, limit=0)
+
+    report(final=True)
+    return stats
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Answer questions from a JSONL file in bulk.")
+    parser.add_argument("input", type=Path, help="JSONL file, one {\"id\": ..., \"question\": ...} per line")
+    parser.add_argument("output", type=Path, help="JSONL file answers are appended to (also the checkpoint)")
+    parser.add_argument("--mode", choices=["online", "offline"], default="online")
+    parser.add_argument("--batch-size", type=int, default=256, help="questions per encode + FAISS search")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel LLM calls")
+    parser.add_argument("--rate", type=float, default=5.0, help="max LLM provider requests per second (0 = unlimited)")
+    parser.add_argument("--hedge", action="store_true", help="hedge slow requests (extra provider calls, also rate limited)")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--question-field", default="question")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--include-contexts", action="store_true", help="also write full chunk texts")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between progress lines")
+    args = parser.parse_args(argv)
+
+    run_bulk(
+        args.input,
+        args.output,
+        mode=args.mode,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        top_k=args.top_k,
+        question_field=args.question_field,
+        id_field=args.id_field,
+        include_contexts=args.include_contexts,
+        report_every=args.report_every,
+        hedge=args.hedge,
+    )
+
+
+if __name__ == "__main__":
+    main()
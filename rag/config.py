@@ -14,6 +14,18 @@ ARTIFACTS_DIR.mkdir(exist_ok=True)
 
 FAISS_INDEX_PATH = ARTIFACTS_DIR / "faiss.index"
 METADATA_PATH = ARTIFACTS_DIR / "metadata.json"
+METADATA_OFFSETS_PATH = ARTIFACTS_DIR / "metadata.offsets.npy"  # byte ranges of each record
+
+# Memory-map the index + metadata read-only instead of copying them into the heap.
+# Lets several app/worker processes on one host share a single page-cache copy.
+FAISS_MMAP = os.getenv("FAISS_MMAP", "false").lower() == "true"
+
+# Compressed index: none, binary (sign bits, 32x smaller) or int8 (scalar quantizer, 4x smaller).
+# Candidates from the compressed index are rescored against float vectors mmapped from disk.
+QUANTIZATION = os.getenv("QUANTIZATION", "none").lower()
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "10"))  # candidates = top_k * factor
+QUANTIZED_INDEX_PATH = ARTIFACTS_DIR / "faiss_quantized.index"
+VECTORS_PATH = ARTIFACTS_DIR / "vectors.npy"  # normalized float32 vectors used for rescoring
 
 
 EMBEDDING_MODEL_NAME = os.getenv(
@@ -35,6 +47,33 @@ OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "x-ai/grok-beta")
 USE_OLLAMA = os.getenv("USE_OLLAMA", "false").lower() == "true"
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")  # or phi3:mini, mistral, etc
 
+# Base URLs (override to point at a proxy or local stub servers)
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+
+# Provider routing in online mode: hedging + failover between the configured providers
+LLM_HEDGING = os.getenv("LLM_HEDGING", "true").lower() == "true"
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "2.0"))  # seconds, until we have latency samples
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.5"))
+HEDGE_MAX_DELAY = float(os.getenv("HEDGE_MAX_DELAY", "8.0"))
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", "50"))  # recent calls kept per provider
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))  # consecutive failures before skipping a provider
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))  # seconds before trying it again
+
+# Identical questions arriving at the same time share one retrieval + LLM call (not a cache)
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "true").lower() == "true"
+
+# Ingestion of PDFs / images
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0")) or (os.cpu_count() or 1)  # 0 = all cores
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))  # pages handed to a worker at once
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+OCR_ENABLED = os.getenv("OCR_ENABLED", "false").lower() == "true"  # OCR scanned pages + image files (needs tesseract)
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+# none, caption (index a generated caption as text) or embedding (needs a CLIP embedding model)
+INDEX_IMAGES = os.getenv("INDEX_IMAGES", "none").lower()
+IMAGE_CAPTION_MODEL = os.getenv("IMAGE_CAPTION_MODEL", "Salesforce/blip-image-captioning-base")
+
 
 def ensure_data_dir() -> None:
     DATA_DIR.mkdir(exist_ok=True)
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Any, List
 
 from sentence_transformers import SentenceTransformer
 
@@ -19,3 +19,20 @@ class EmbeddingModel:
         # Could also use show_progress_bar=True for debugging
         return embeddings.tolist()
 
+    def embed_images(self, images: List[Any]) -> List[List[float]]:
+        # PIL images -> vectors in the same space as the text embeddings.
+        # Only meaningful for multi-modal models like sentence-transformers/clip-ViT-B-32
+        embeddings = self._model.encode(images, convert_to_numpy=True, show_progress_bar=False)
+        return embeddings.tolist()
+
+    def supports_images(self) -> bool:
+        # Text-only models fail somewhere inside encode() on image input, so probe once
+        try:
+            from PIL import Image
+        except ImportError:
+            return False
+        try:
+            self.embed_images([Image.new("RGB", (32, 32))])
+        except Exception:  # noqa: BLE001
+            return False
+        return True
@@ -1,19 +1,42 @@
 from __future__ import annotations
 
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterator, List, Tuple
 
-from .config import DATA_DIR, ensure_data_dir
+import numpy as np
+
+from .config import (
+    DATA_DIR,
+    EMBED_BATCH_SIZE,
+    INDEX_IMAGES,
+    INGEST_WORKERS,
+    OCR_ENABLED,
+    ensure_data_dir,
+)
 from .embeddings import EmbeddingModel
+from .loaders import (
+    IMAGE_SUFFIXES,
+    PDF_SUFFIXES,
+    TEXT_SUFFIXES,
+    caption_image,
+    iter_pdf_pages,
+    load_image,
+    ocr_image,
+)
 from .vector_store import FaissVectorStore
 
 
 def load_text_from_file(path: Path) -> str:
-    # Support .txt and .md files for now
-    # could add PDF support later if needed
-    if path.suffix.lower() in [".txt", ".md"]:
+    # Support .txt, .md and .pdf files
+    # (ingest_documents streams PDFs page by page instead of calling this)
+    suffix = path.suffix.lower()
+    if suffix in TEXT_SUFFIXES:
         return path.read_text(encoding="utf-8", errors="ignore")
-    raise ValueError(f"Unsupported file type: {path.suffix}. Supported: .txt, .md")
+    if suffix in PDF_SUFFIXES:
+        return "\n\n".join(text for _, text in iter_pdf_pages(path))
+    raise ValueError(f"Unsupported file type: {path.suffix}. Supported: .txt, .md, .pdf")
 
 
 def simple_chunk_text(text: str, max_chars: int = 800, overlap: int = 200) -> List[str]:
@@ -32,48 +55,135 @@ def simple_chunk_text(text: str, max_chars: int = 800, overlap: int = 200) -> Li
     return chunks
 
 
+IMAGE_MODES = ("none", "caption", "embedding")
+
+
+def supported_suffixes() -> set:
+    suffixes = TEXT_SUFFIXES | PDF_SUFFIXES
+    if OCR_ENABLED or INDEX_IMAGES != "none":
+        suffixes = suffixes | IMAGE_SUFFIXES
+    return suffixes
+
+
+def iter_document_chunks(path: Path, executor: Executor | None = None) -> Iterator[Tuple[int | None, str, str]]:
+    # Yields (page, modality, chunk text). page is None for files without pages.
+    # Chunks never span PDF pages so every chunk can cite exactly one page.
+    suffix = path.suffix.lower()
+    if suffix in PDF_SUFFIXES:
+        for page, text in iter_pdf_pages(path, executor):
+            for chunk in simple_chunk_text(text):
+                yield page, "text", chunk
+    elif suffix in IMAGE_SUFFIXES:
+        if OCR_ENABLED:
+            for chunk in simple_chunk_text(ocr_image(load_image(path))):
+                yield None, "image_text", chunk
+        if INDEX_IMAGES == "caption":
+            caption = caption_image(path).strip()
+            if caption:
+                yield None, "image_caption", f"Image {path.name}: {caption}"
+    else:
+        for chunk in simple_chunk_text(load_text_from_file(path)):
+            yield None, "text", chunk
+
+
 def ingest_documents():
     # Load documents from DATA_DIR, chunk them, embed, and build FAISS index
     ensure_data_dir()
-    # Get all files and filter for supported extensions (.txt, .md)
+    if INDEX_IMAGES not in IMAGE_MODES:
+        raise ValueError(f"Unknown INDEX_IMAGES: {INDEX_IMAGES}. Use none, caption or embedding.")
+    suffixes = supported_suffixes()
     files = sorted(
-        p for p in DATA_DIR.iterdir() 
-        if p.is_file() and p.suffix.lower() in [".txt", ".md"]
+        p for p in DATA_DIR.iterdir()
+        if p.is_file() and p.suffix.lower() in suffixes
     )
     if not files:
-        raise RuntimeError(f"No .txt or .md files found in {DATA_DIR}. Place your documents there.")
+        raise RuntimeError(f"No supported files ({', '.join(sorted(suffixes))}) found in {DATA_DIR}. Place your documents there.")
 
     print(f"Found {len(files)} documents to process")
-    all_chunks: List[str] = []
+
+    # Workers are only started on the first submit, after the model is loaded, so they
+    # must be spawned: forking a process that holds torch and runs threads (e.g. the
+    # Streamlit server) can deadlock.
+    has_pdfs = any(p.suffix.lower() in PDF_SUFFIXES for p in files)
+    executor = None
+    if has_pdfs and INGEST_WORKERS > 1:
+        executor = ProcessPoolExecutor(max_workers=INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+    try:
+        embedder = EmbeddingModel()
+        if INDEX_IMAGES == "embedding" and any(p.suffix.lower() in IMAGE_SUFFIXES for p in files):
+            if not embedder.supports_images():
+                raise ValueError(
+                    f"INDEX_IMAGES=embedding needs a multi-modal embedding model such as "
+                    f"sentence-transformers/clip-ViT-B-32; {embedder.model_name} can't embed images."
+                )
+        _ingest_files(files, embedder, executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def _ingest_files(files: List[Path], embedder: EmbeddingModel, executor: Executor | None) -> None:
+    # Page text is only held per page batch while it is chunked and embedded,
+    # but chunk metadata (including text) and embeddings for the whole corpus
+    # stay in memory until the index is built and saved.
+    vectors: List[np.ndarray] = []
     metadatas: List[Dict] = []
+    pending: List[str] = []
+
+    def flush() -> None:
+        if pending:
+            vectors.append(np.asarray(embedder.embed(pending), dtype="float32"))
+            pending.clear()
 
     for doc_id, path in enumerate(files):
-        text = load_text_from_file(path)
-        chunks = simple_chunk_text(text)
-        # chunks = simple_chunk_text(text, max_chars=1000)  # can adjust size
-        print(f"  {path.name}: {len(chunks)} chunks")
-        for chunk_id, chunk in enumerate(chunks):
-            all_chunks.append(chunk)
+        n_chunks = 0
+        for chunk_id, (page, modality, chunk) in enumerate(iter_document_chunks(path, executor)):
+            pending.append(chunk)
             metadatas.append(
                 {
                     "doc_id": doc_id,
                     "source": path.name,
                     "chunk_id": chunk_id,
+                    "page": page,
+                    "modality": modality,
                     "text": chunk,
                 }
             )
+            n_chunks += 1
+            if len(pending) >= EMBED_BATCH_SIZE:
+                flush()
+
+        if INDEX_IMAGES == "embedding" and path.suffix.lower() in IMAGE_SUFFIXES:
+            # image goes into the same index as text, only works with a CLIP-style model
+            flush()
+            vectors.append(np.asarray(embedder.embed_images([load_image(path)]), dtype="float32"))
+            metadatas.append(
+                {
+                    "doc_id": doc_id,
+                    "source": path.name,
+                    "chunk_id": n_chunks,
+                    "page": None,
+                    "modality": "image",
+                    "text": f"[Image: {path.name}]",
+                }
+            )
+            n_chunks += 1
+        print(f"  {path.name}: {n_chunks} chunks")
+    flush()
 
-    print(f"Total chunks: {len(all_chunks)}")
-    print("Generating embeddings...")
-    embedder = EmbeddingModel()
-    embeddings = embedder.embed(all_chunks)
+    print(f"Total chunks: {len(metadatas)}")
+    if not metadatas:
+        raise RuntimeError("No text could be extracted from the documents.")
 
     print("Building FAISS index...")
     store = FaissVectorStore()
-    store.build(embeddings, metadatas)
+    store.build(np.vstack(vectors), metadatas)
+    if store.quantization != "none":
+        # sanity check that the compressed index + rescoring still finds the right chunks
+        print(f"Quantized ({store.quantization}) recall@5 vs exact search: {store.check_recall(top_k=5):.3f}")
     print("Done!")
 
 
 if __name__ == "__main__":
     ingest_documents()
-
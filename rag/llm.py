@@ -1,27 +1,34 @@
 from __future__ import annotations
 
 import json
-from typing import Any, Dict, List
+import threading
+from typing import Any, Callable, Dict, Iterator, List
 
 import requests
 
 from .config import (
     GROQ_API_KEY,
+    GROQ_BASE_URL,
     GROQ_MODEL,
+    LLM_HEDGING,
     LLM_PROVIDER,
+    OLLAMA_BASE_URL,
     OLLAMA_MODEL,
     OPENROUTER_API_KEY,
+    OPENROUTER_BASE_URL,
     OPENROUTER_MODEL,
     USE_OLLAMA,
 )
+from .router import ProviderError, ProviderRouter
 
 
 def build_rag_prompt(question: str, contexts: List[Dict[str, Any]]) -> str:
     # Build the prompt with retrieved context chunks
     context_blocks = []
     for i, c in enumerate(contexts, start=1):
+        page = f" | page={c['page']}" if c.get("page") is not None else ""
         context_blocks.append(
-            f"[Chunk {i} | source={c.get('source')} | score={c.get('score'):.3f}]\n{c.get('text')}"
+            f"[Chunk {i} | source={c.get('source')}{page} | score={c.get('score'):.3f}]\n{c.get('text')}"
         )
     context_text = "\n\n".join(context_blocks) if context_blocks else "No context retrieved."
 
@@ -40,99 +47,269 @@ def build_rag_prompt(question: str, contexts: List[Dict[str, Any]]) -> str:
     return prompt
 
 
-def call_openrouter(prompt: str) -> str:
-    if not OPENROUTER_API_KEY:
-        return "Error: OPENROUTER_API_KEY not configured."
-
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-    }
-    body: Dict[str, Any] = {
+def _openrouter_body(prompt: str) -> Dict[str, Any]:
+    # shared by request_openrouter and stream_openrouter so both ask the same thing
+    return {
         "model": OPENROUTER_MODEL,
         "messages": [
             {"role": "system", "content": "You are a helpful, grounded assistant."},
             {"role": "user", "content": prompt},
         ],
     }
-    resp = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, data=json.dumps(body))
+
+
+def _groq_body(prompt: str) -> Dict[str, Any]:
+    # shared by request_groq and stream_groq
+    return {
+        "model": GROQ_MODEL,
+        "messages": [
+            {"role": "system", "content": "You are a helpful, grounded assistant."},
+            {"role": "user", "content": prompt},
+        ],
+        "temperature": 0.3,  # lower temp = more focused
+        "max_tokens": 1024,
+    }
+
+
+def request_openrouter(prompt: str) -> str:
+    # Like call_openrouter but raises ProviderError, used by the router
+    if not OPENROUTER_API_KEY:
+        raise ProviderError("Error: OPENROUTER_API_KEY not configured.")
+
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json",
+    }
+    body = _openrouter_body(prompt)
+    try:
+        resp = requests.post(f"{OPENROUTER_BASE_URL}/chat/completions", headers=headers, data=json.dumps(body), timeout=60)
+    except requests.exceptions.RequestException as e:
+        raise ProviderError(f"Error: Could not reach OpenRouter API: {e}") from e
     if resp.status_code != 200:
-        return f"OpenRouter API error: {resp.status_code}"
+        raise ProviderError(f"OpenRouter API error: {resp.status_code}", resp.status_code)
     data = resp.json()
     try:
         return data["choices"][0]["message"]["content"]
-    except Exception:
-        return "Error parsing OpenRouter response."
+    except Exception as e:
+        raise ProviderError("Error parsing OpenRouter response.") from e
 
 
-def call_groq(prompt: str) -> str:
+def request_groq(prompt: str) -> str:
     # Call Groq API for fast inference
     if not GROQ_API_KEY:
-        return "Error: GROQ_API_KEY not configured."
+        raise ProviderError("Error: GROQ_API_KEY not configured.")
 
     headers = {
         "Authorization": f"Bearer {GROQ_API_KEY}",
         "Content-Type": "application/json",
     }
-    body: Dict[str, Any] = {
-        "model": GROQ_MODEL,
-        "messages": [
-            {"role": "system", "content": "You are a helpful, grounded assistant."},
-            {"role": "user", "content": prompt},
-        ],
-        "temperature": 0.3,  # lower temp = more focused
-        "max_tokens": 1024,
-    }
+    body = _groq_body(prompt)
     try:
-        resp = requests.post("https://api.groq.com/openai/v1/chat/completions", headers=headers, json=body, timeout=30)
+        resp = requests.post(f"{GROQ_BASE_URL}/chat/completions", headers=headers, json=body, timeout=30)
     except requests.exceptions.RequestException as e:
-        return f"Error: Could not reach Groq API: {e}"
-    
+        raise ProviderError(f"Error: Could not reach Groq API: {e}") from e
+
     if resp.status_code != 200:
         # print(f"Groq error: {resp.status_code}")  # debug
-        return f"Error: Groq API returned {resp.status_code}"
-    
+        raise ProviderError(f"Error: Groq API returned {resp.status_code}", resp.status_code)
+
     data = resp.json()
     try:
         return data["choices"][0]["message"]["content"]
-    except Exception:
-        return "Error: Unexpected response format from Groq."
+    except Exception as e:
+        raise ProviderError("Error: Unexpected response format from Groq.") from e
 
 
-def call_ollama(prompt: str) -> str:
+def request_ollama(prompt: str) -> str:
     if not USE_OLLAMA:
-        return "Error: Offline LLM (Ollama) not enabled. Set USE_OLLAMA=true in .env."
+        raise ProviderError("Error: Offline LLM (Ollama) not enabled. Set USE_OLLAMA=true in .env.")
 
     try:
         resp = requests.post(
-            "http://localhost:11434/api/generate",
+            f"{OLLAMA_BASE_URL}/api/generate",
             json={"model": OLLAMA_MODEL, "prompt": prompt, "stream": False},
             timeout=60,  # ollama can be slow
         )
     except Exception as e:  # noqa: BLE001
-        return f"Error: Could not reach Ollama: {e}"
+        raise ProviderError(f"Error: Could not reach Ollama: {e}") from e
 
     if resp.status_code != 200:
-        return f"Ollama error: {resp.status_code} - {resp.text}"
+        raise ProviderError(f"Ollama error: {resp.status_code} - {resp.text}", resp.status_code)
 
     data = resp.json()
-    return data.get("response", "Error: Unexpected Ollama response format.")
+    if "response" not in data:
+        raise ProviderError("Error: Unexpected Ollama response format.")
+    return data["response"]
 
 
-def generate_answer(question: str, contexts: List[Dict[str, Any]], mode: str = "online") -> str:
-    # Generate answer using configured LLM provider
+def _as_text(request_fn: Callable[[str], str], prompt: str) -> str:
+    # The call_* helpers return the error message instead of raising
+    try:
+        return request_fn(prompt)
+    except ProviderError as e:
+        return str(e)
+
+
+def call_openrouter(prompt: str) -> str:
+    return _as_text(request_openrouter, prompt)
+
+
+def call_groq(prompt: str) -> str:
+    return _as_text(request_groq, prompt)
+
+
+def call_ollama(prompt: str) -> str:
+    return _as_text(request_ollama, prompt)
+
+
+def _stream_chat(name: str, url: str, api_key: str, body: Dict[str, Any]) -> Iterator[str]:
+    # OpenAI-style server-sent events, shared by Groq and OpenRouter
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+    try:
+        with requests.post(url, headers=headers, json={**body, "stream": True}, stream=True, timeout=30) as resp:
+            if resp.status_code != 200:
+                raise ProviderError(f"Error: {name} API returned {resp.status_code}", resp.status_code)
+            resp.encoding = resp.encoding or "utf-8"  # decode_unicode yields bytes without one
+            for line in resp.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                token = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                if token:
+                    yield token
+    except requests.exceptions.RequestException as e:
+        raise ProviderError(f"Error: Could not reach {name} API: {e}") from e
+    except (ValueError, KeyError, IndexError) as e:
+        raise ProviderError(f"Error: Unexpected streaming response from {name}.") from e
+
+
+def stream_groq(prompt: str) -> Iterator[str]:
+    if not GROQ_API_KEY:
+        raise ProviderError("Error: GROQ_API_KEY not configured.")
+    yield from _stream_chat("Groq", f"{GROQ_BASE_URL}/chat/completions", GROQ_API_KEY, _groq_body(prompt))
+
+
+def stream_openrouter(prompt: str) -> Iterator[str]:
+    if not OPENROUTER_API_KEY:
+        raise ProviderError("Error: OPENROUTER_API_KEY not configured.")
+    yield from _stream_chat(
+        "OpenRouter", f"{OPENROUTER_BASE_URL}/chat/completions", OPENROUTER_API_KEY, _openrouter_body(prompt)
+    )
+
+
+def stream_ollama(prompt: str) -> Iterator[str]:
+    if not USE_OLLAMA:
+        raise ProviderError("Error: Offline LLM (Ollama) not enabled. Set USE_OLLAMA=true in .env.")
+    try:
+        with requests.post(
+            f"{OLLAMA_BASE_URL}/api/generate",
+            json={"model": OLLAMA_MODEL, "prompt": prompt, "stream": True},
+            stream=True,
+            timeout=60,
+        ) as resp:
+            if resp.status_code != 200:
+                raise ProviderError(f"Ollama error: {resp.status_code} - {resp.text}", resp.status_code)
+            # newline-delimited JSON objects: {"response": "...", "done": false}
+            resp.encoding = resp.encoding or "utf-8"  # decode_unicode yields bytes without one
+            for line in resp.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    break
+    except requests.exceptions.RequestException as e:
+        raise ProviderError(f"Error: Could not reach Ollama: {e}") from e
+    except ValueError as e:
+        raise ProviderError("Error: Unexpected Ollama response format.") from e
+
+
+STREAMERS: Dict[str, Callable[[str], Iterator[str]]] = {
+    "groq": stream_groq,
+    "openrouter": stream_openrouter,
+    "ollama": stream_ollama,
+}
+
+
+_router: ProviderRouter | None = None
+_router_lock = threading.Lock()
+
+
+def build_router(
+    hedging: bool = LLM_HEDGING,
+    before_call: Callable[[], None] | None = None,
+) -> ProviderRouter | None:
+    # Online providers that are actually configured, LLM_PROVIDER first.
+    # Ollama (if enabled) is only a last-resort fallback. None if nothing is configured.
+    online = []
+    if GROQ_API_KEY:
+        online.append(("groq", request_groq))
+    if OPENROUTER_API_KEY:
+        online.append(("openrouter", request_openrouter))
+    online.sort(key=lambda p: p[0] != LLM_PROVIDER)
+    fallbacks = [("ollama", request_ollama)] if USE_OLLAMA else []
+    if not online and not fallbacks:
+        return None
+    return ProviderRouter(online, fallbacks, hedging=hedging, before_call=before_call)
+
+
+def get_router() -> ProviderRouter | None:
+    # shared router for the app, so latency stats and breakers are process-wide
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = build_router()
+        return _router
+
+
+def request_answer(
+    question: str,
+    contexts: List[Dict[str, Any]],
+    mode: str = "online",
+    router: ProviderRouter | None = None,
+) -> str:
+    # Like generate_answer but raises ProviderError instead of returning the error text
     prompt = build_rag_prompt(question, contexts)
-    
+
     if mode == "offline":
-        return call_ollama(prompt)
-    
-    # Online mode - check which provider to use
+        return request_ollama(prompt)
+
+    # Online mode - route over the configured providers (hedging + failover)
     # Could also add anthropic here later if needed
-    if LLM_PROVIDER == "groq":
-        return call_groq(prompt)
-    elif LLM_PROVIDER == "openrouter":
-        return call_openrouter(prompt)
-    else:
-        # just default to groq
-        return call_groq(prompt)
+    router = router or get_router()
+    if router is None:
+        # nothing configured, surface the config error for the selected provider
+        return request_openrouter(prompt) if LLM_PROVIDER == "openrouter" else request_groq(prompt)
+    return router.complete(prompt)
+
 
+def generate_answer(question: str, contexts: List[Dict[str, Any]], mode: str = "online") -> str:
+    # Generate answer using configured LLM provider
+    try:
+        return request_answer(question, contexts, mode=mode)
+    except ProviderError as e:
+        return str(e)
+
+
+def stream_answer(question: str, contexts: List[Dict[str, Any]], mode: str = "online") -> Iterator[str]:
+    # Same as generate_answer but yields tokens as they arrive.
+    # Errors are yielded as text too, so callers can render the stream as-is.
+    prompt = build_rag_prompt(question, contexts)
+
+    try:
+        if mode == "offline":
+            yield from stream_ollama(prompt)
+            return
+        router = get_router()
+        if router is None:
+            yield call_openrouter(prompt) if LLM_PROVIDER == "openrouter" else call_groq(prompt)
+            return
+        yield from router.stream(prompt, STREAMERS)
+    except ProviderError as e:
+        yield str(e)
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+from .config import IMAGE_CAPTION_MODEL, OCR_ENABLED, OCR_LANG, PDF_PAGES_PER_TASK
+
+TEXT_SUFFIXES = {".txt", ".md"}
+PDF_SUFFIXES = {".pdf"}
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp"}
+
+_captioner = None
+
+
+def _require(module: str, package: str):
+    # Optional deps are imported lazily so plain .txt/.md ingestion works without them
+    try:
+        return __import__(module)
+    except ImportError as e:
+        raise ImportError(f"{package} is required for this file type: pip install {package}") from e
+
+
+@contextmanager
+def _open_pdf(path: str):
+    # PdfReader(path) would read the whole file into memory; on a file handle it
+    # reads objects from disk as they are needed. The reader (and the objects it
+    # has resolved) is dropped when the block ends, so nothing piles up across batches.
+    pypdf = _require("pypdf", "pypdf")
+    with open(path, "rb") as f:
+        yield pypdf.PdfReader(f)
+
+
+def pdf_page_count(path: Path) -> int:
+    # only the xref table and page tree are parsed, page contents aren't touched
+    with _open_pdf(str(path)) as reader:
+        return len(reader.pages)
+
+
+def ocr_image(image) -> str:
+    pytesseract = _require("pytesseract", "pytesseract")
+    return pytesseract.image_to_string(image, lang=OCR_LANG)
+
+
+def _ocr_pdf_page(path: str, page_index: int) -> str:
+    pdfium = _require("pypdfium2", "pypdfium2")
+    pdf = pdfium.PdfDocument(path)
+    try:
+        # 300 dpi is about what tesseract wants for drawings / small print
+        image = pdf[page_index].render(scale=300 / 72).to_pil()
+        return ocr_image(image)
+    finally:
+        pdf.close()
+
+
+def extract_pdf_pages(path: str, start: int, end: int, ocr: bool = False) -> List[Tuple[int, str]]:
+    # Runs in a worker process: returns (1-based page number, text) for pages [start, end)
+    pages: List[Tuple[int, str]] = []
+    with _open_pdf(path) as reader:
+        for i in range(start, end):
+            text = reader.pages[i].extract_text() or ""
+            if ocr and not text.strip():
+                # no text layer -> most likely a scanned page
+                text = _ocr_pdf_page(path, i)
+            pages.append((i + 1, text))
+    return pages
+
+
+def iter_pdf_pages(
+    path: Path,
+    executor: Executor | None = None,
+    ocr: bool | None = None,
+    pages_per_task: int | None = None,
+    max_pending: int = 8,
+) -> Iterator[Tuple[int, str]]:
+    # Stream (page number, text) in page order.
+    # At most max_pending page batches are in flight, so memory stays bounded
+    # even for documents with thousands of pages.
+    ocr = OCR_ENABLED if ocr is None else ocr
+    step = pages_per_task or PDF_PAGES_PER_TASK
+    n_pages = pdf_page_count(path)
+    batches = iter(range(0, n_pages, step))
+
+    if executor is None:
+        for start in batches:
+            yield from extract_pdf_pages(str(path), start, min(start + step, n_pages), ocr)
+        return
+
+    pending = deque()
+
+    def submit_next() -> bool:
+        start = next(batches, None)
+        if start is None:
+            return False
+        pending.append(executor.submit(extract_pdf_pages, str(path), start, min(start + step, n_pages), ocr))
+        return True
+
+    while len(pending) < max_pending and submit_next():
+        pass
+    while pending:
+        pages = pending.popleft().result()
+        submit_next()
+        yield from pages
+
+
+def caption_image(path: Path) -> str:
+    # Loaded once in the main process, captioning models are too big to copy into every worker
+    global _captioner
+    if _captioner is None:
+        transformers = _require("transformers", "transformers")
+        _captioner = transformers.pipeline("image-to-text", model=IMAGE_CAPTION_MODEL)
+    out = _captioner(str(path))
+    return out[0].get("generated_text", "") if out else ""
+
+
+def load_image(path: Path):
+    pil = _require("PIL.Image", "pillow")
+    return pil.Image.open(path).convert("RGB")
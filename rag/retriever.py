@@ -20,20 +20,33 @@ class Retriever:
             self.store.load()
             self._loaded = True
 
-    def retrieve(self, query: str) -> List[Dict[str, Any]]:
+    @property
+    def index_version(self) -> str | None:
         self._ensure_loaded()
-        q_emb = self.embedder.embed([query])[0]
-        results = self.store.search(q_emb, top_k=self.top_k)
-        
-        # build context list
-        contexts = []
-        for meta, score in results:
-            contexts.append({
-                "score": score,
-                "source": meta.get("source"),
-                "chunk_id": meta.get("chunk_id"),
-                "doc_id": meta.get("doc_id"),
-                "text": meta.get("text"),
-            })
-        return contexts
+        return self.store.version
+
+    def retrieve(self, query: str) -> List[Dict[str, Any]]:
+        return self.retrieve_batch([query])[0]
 
+    def retrieve_batch(self, queries: List[str]) -> List[List[Dict[str, Any]]]:
+        # one encode + one FAISS search for the whole batch
+        self._ensure_loaded()
+        q_embs = self.embedder.embed(queries)
+        batch_results = self.store.search_batch(q_embs, top_k=self.top_k)
+
+        # build context lists
+        all_contexts = []
+        for results in batch_results:
+            contexts = []
+            for meta, score in results:
+                contexts.append({
+                    "score": score,
+                    "source": meta.get("source"),
+                    "chunk_id": meta.get("chunk_id"),
+                    "doc_id": meta.get("doc_id"),
+                    "page": meta.get("page"),
+                    "modality": meta.get("modality", "text"),
+                    "text": meta.get("text"),
+                })
+            all_contexts.append(contexts)
+        return all_contexts
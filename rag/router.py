@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from .config import (
+    BREAKER_COOLDOWN,
+    BREAKER_FAILURES,
+    HEDGE_DEFAULT_DELAY,
+    HEDGE_MAX_DELAY,
+    HEDGE_MIN_DELAY,
+    LATENCY_WINDOW,
+)
+
+
+class ProviderError(RuntimeError):
+    # Raised by the request_* functions in llm.py; str(e) is the user-facing error message
+    def __init__(self, message: str, status_code: int | None = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ProviderStats:
+    # Rolling latency / error window for one provider plus a simple circuit breaker:
+    # after `failures` consecutive errors the provider is skipped for `cooldown` seconds,
+    # then a single trial request is let through (half-open).
+
+    def __init__(self, window: int = LATENCY_WINDOW, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN) -> None:
+        self.latencies: deque = deque(maxlen=window)  # full completion time
+        self.first_token: deque = deque(maxlen=window)  # time to first token of streamed answers
+        self.outcomes: deque = deque(maxlen=window)  # True = success
+        self.failure_threshold = failures
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def record_success(self, latency: float, streaming: bool = False) -> None:
+        with self._lock:
+            (self.first_token if streaming else self.latencies).append(latency)
+            self.outcomes.append(True)
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.outcomes.append(False)
+            self.consecutive_failures += 1
+            self.trial_in_flight = False
+            if self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()  # (re)open the breaker
+
+    def release(self) -> None:
+        # a request admitted by allow() was never sent
+        with self._lock:
+            self.trial_in_flight = False
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self.trial_in_flight:
+                return False
+            self.trial_in_flight = True  # half-open: let one request probe the provider
+            return True
+
+    def p95(self, streaming: bool = False) -> float | None:
+        with self._lock:
+            samples = self.first_token if streaming else self.latencies
+            if not samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self.outcomes:
+                return 0.0
+            return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    def expected_latency(self, streaming: bool = False) -> float:
+        # slow or flaky providers sort last
+        p95 = self.p95(streaming)
+        base = p95 if p95 is not None else HEDGE_DEFAULT_DELAY
+        return base / max(1.0 - self.error_rate(), 0.1)
+
+
+class ProviderRouter:
+    # Routes a prompt over several providers (name -> callable raising ProviderError).
+    # - ranks providers by rolling p95 latency and error rate
+    # - if the first one hasn't answered after its p95 (clamped), sends a hedged
+    #   request to the next provider and returns whichever succeeds first
+    # - on errors fails over to the next provider, skipping ones with an open breaker
+    # `fallbacks` are only tried once every ranked provider failed (e.g. a local Ollama).
+    # `before_call` runs before every provider request, hedges and failovers included
+    # (e.g. a rate limiter). It runs in the calling thread before the request is sent,
+    # so time spent in it counts neither as provider latency nor towards the hedge delay.
+
+    def __init__(
+        self,
+        providers: List[Tuple[str, Callable[[str], str]]],
+        fallbacks: List[Tuple[str, Callable[[str], str]]] | None = None,
+        hedging: bool = True,
+        before_call: Callable[[], None] | None = None,
+    ) -> None:
+        self.providers = list(providers)
+        self.before_call = before_call
+        self.fallbacks = list(fallbacks or [])
+        self.hedging = hedging
+        self.stats: Dict[str, ProviderStats] = {name: ProviderStats() for name, _ in self.providers + self.fallbacks}
+
+    def _ranked(self, streaming: bool = False) -> List[Tuple[str, Callable[[str], str]]]:
+        # sorted() is stable, so with no samples yet the configured order wins
+        return sorted(self.providers, key=lambda p: self.stats[p[0]].expected_latency(streaming))
+
+    def hedge_delay(self, name: str, streaming: bool = False) -> float:
+        p95 = self.stats[name].p95(streaming)
+        if p95 is None:
+            return HEDGE_DEFAULT_DELAY
+        return min(max(p95, HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+    @staticmethod
+    def _spawn(fn: Callable, *args) -> Future:
+        # One daemon thread per request instead of a pool: a hung loser request
+        # never blocks interpreter exit, and hedges never queue behind primaries.
+        future: Future = Future()
+
+        def run() -> None:
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:  # noqa: BLE001
+                future.set_exception(e)
+
+        threading.Thread(target=run, daemon=True, name="llm-request").start()
+        return future
+
+    def _timed_call(self, name: str, fn: Callable[[str], str], prompt: str) -> str:
+        start = time.monotonic()
+        try:
+            result = fn(prompt)
+        except Exception:
+            self.stats[name].record_failure()
+            raise
+        self.stats[name].record_success(time.monotonic() - start)
+        return result
+
+    def complete(self, prompt: str) -> str:
+        ranked = self._ranked()
+        queue = ranked + self.fallbacks
+        in_flight: Dict[Future, str] = {}
+        last_error: Exception | None = None
+        pos = 0
+
+        def start_next(force: bool = False) -> bool:
+            nonlocal pos
+            while pos < len(queue):
+                name, fn = queue[pos]
+                pos += 1
+                if force or self.stats[name].allow():
+                    if self.before_call is not None:
+                        self.before_call()
+                    in_flight[self._spawn(self._timed_call, name, fn, prompt)] = name
+                    return True
+            return False
+
+        if not start_next():
+            # every breaker is open: better to try the best one anyway than fail without a request
+            pos = 0
+            start_next(force=True)
+
+        while in_flight:
+            # hedge only between ranked providers, fallbacks just wait their turn
+            can_hedge = self.hedging and len(in_flight) == 1 and pos < len(ranked)
+            timeout = self.hedge_delay(next(iter(in_flight.values()))) if can_hedge else None
+            done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                start_next()  # slow primary: send the hedged request
+                continue
+
+            for future in done:
+                in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:  # noqa: BLE001
+                    last_error = e
+                    continue
+                # Winner. Loser requests can't be interrupted mid-read with `requests`,
+                # so cancel those not started yet and drop the rest (their timing still counts).
+                for loser, name in in_flight.items():
+                    if loser.cancel():
+                        self.stats[name].release()
+                return result
+
+            if not in_flight:
+                start_next()  # everything in flight failed: fail over
+
+        raise _final_error(last_error)
+
+    @staticmethod
+    def _pump(attempt: int, fn: Callable[[str], Iterator[str]], prompt: str, events: queue.Queue, cancel: threading.Event) -> None:
+        # Feeds one provider's stream into the shared event queue until done or cancelled.
+        # Closing the generator closes its HTTP response, which ends the request.
+        tokens = fn(prompt)
+        try:
+            for token in tokens:
+                if cancel.is_set():
+                    return
+                events.put((attempt, "token", token))
+            events.put((attempt, "done", None))
+        except Exception as e:  # noqa: BLE001
+            events.put((attempt, "error", e))
+        finally:
+            tokens.close()
+
+    def stream(self, prompt: str, streamers: Dict[str, Callable[[str], Iterator[str]]]) -> Iterator[str]:
+        # Streaming variant of complete(): hedging is decided on time to first token
+        # (tracked separately from full completion latency). The first provider to
+        # produce a token wins and the others are cancelled; failover is only possible
+        # before that, tokens from two providers can't be merged.
+        ranked = [p for p in self._ranked(streaming=True) if p[0] in streamers]
+        queue_ = ranked + [p for p in self.fallbacks if p[0] in streamers]
+        events: queue.Queue = queue.Queue()
+        attempts: Dict[int, Tuple[str, threading.Event, float]] = {}
+        last_error: Exception | None = None
+        pos = 0
+
+        def start_next(force: bool = False) -> bool:
+            nonlocal pos
+            while pos < len(queue_):
+                name, _ = queue_[pos]
+                pos += 1
+                if force or self.stats[name].allow():
+                    if self.before_call is not None:
+                        self.before_call()
+                    cancel = threading.Event()
+                    attempts[pos] = (name, cancel, time.monotonic())
+                    threading.Thread(
+                        target=self._pump,
+                        args=(pos, streamers[name], prompt, events, cancel),
+                        daemon=True,
+                        name="llm-stream",
+                    ).start()
+                    return True
+            return False
+
+        if not start_next() and queue_:
+            # every breaker is open: better to try the best one anyway than fail without a request
+            pos = 0
+            start_next(force=True)
+
+        winner: int | None = None
+        try:
+            # phase 1: race for the first token
+            while winner is None and attempts:
+                can_hedge = self.hedging and len(attempts) == 1 and pos < len(ranked)
+                primary = next(iter(attempts.values()))[0]
+                timeout = self.hedge_delay(primary, streaming=True) if can_hedge else None
+                try:
+                    attempt, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    start_next()  # no first token yet: send the hedged request
+                    continue
+
+                if attempt not in attempts:
+                    continue
+                name, _, started = attempts[attempt]
+                if kind == "error":
+                    self.stats[name].record_failure()
+                    last_error = payload
+                    del attempts[attempt]
+                    if not attempts:
+                        start_next()  # fail over
+                    continue
+
+                winner = attempt
+                self.stats[name].record_success(time.monotonic() - started, streaming=True)
+                for other, (other_name, cancel, _) in list(attempts.items()):
+                    if other != winner:
+                        cancel.set()
+                        self.stats[other_name].release()
+                        del attempts[other]
+                if kind == "done":
+                    return  # finished without producing any text
+                yield payload
+
+            if winner is None:
+                raise _final_error(last_error)
+
+            # phase 2: relay the winner, ignoring leftovers from cancelled attempts
+            while True:
+                attempt, kind, payload = events.get()
+                if attempt != winner:
+                    continue
+                if kind == "token":
+                    yield payload
+                elif kind == "done":
+                    return
+                else:
+                    self.stats[attempts[winner][0]].record_failure()
+                    raise payload
+        finally:
+            # also runs when the consumer goes away mid-stream
+            for name, cancel, _ in attempts.values():
+                cancel.set()
+
+
+def _final_error(last_error: Exception | None) -> ProviderError:
+    if isinstance(last_error, ProviderError):
+        return last_error
+    if last_error is None:
+        return ProviderError("Error: no LLM provider available.")
+    return ProviderError(f"Error: all LLM providers failed ({last_error})")
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Iterator, List
+
+from .config import COALESCE_REQUESTS
+from .llm import generate_answer, stream_answer
+
+if TYPE_CHECKING:
+    from .retriever import Retriever
+
+
+class _Call:
+    # One in-flight computation, shared by everyone asking for the same key
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class _Broadcast:
+    # Tokens produced once, replayed to every subscriber (late joiners start from the beginning)
+    def __init__(self) -> None:
+        self.tokens: List[str] = []
+        self.finished = False
+        self.error: BaseException | None = None
+        self.cond = threading.Condition()
+
+    def publish(self, token: str) -> None:
+        with self.cond:
+            self.tokens.append(token)
+            self.cond.notify_all()
+
+    def close(self, error: BaseException | None = None) -> None:
+        with self.cond:
+            self.finished = True
+            self.error = error
+            self.cond.notify_all()
+
+    def subscribe(self) -> Iterator[str]:
+        i = 0
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: i < len(self.tokens) or self.finished)
+                pending = self.tokens[i:]
+                finished, error = self.finished, self.error
+            for token in pending:
+                yield token
+            i += len(pending)
+            if finished and i >= len(self.tokens):
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one execution (no caching:
+    # the key is forgotten as soon as the computation finishes).
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._streams: Dict[Hashable, _Broadcast] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def stream(self, key: Hashable, fn: Callable[[], Iterator[str]]) -> Iterator[str]:
+        # The producer runs in its own thread, so one waiter disconnecting
+        # doesn't cut the stream for the others.
+        with self._lock:
+            broadcast = self._streams.get(key)
+            if broadcast is None:
+                broadcast = self._streams[key] = _Broadcast()
+                threading.Thread(target=self._produce, args=(key, broadcast, fn), daemon=True).start()
+        return broadcast.subscribe()
+
+    def _produce(self, key: Hashable, broadcast: _Broadcast, fn: Callable[[], Iterator[str]]) -> None:
+        error: BaseException | None = None
+        try:
+            for token in fn():
+                broadcast.publish(token)
+        except BaseException as e:  # noqa: BLE001
+            error = e
+        finally:
+            with self._lock:
+                self._streams.pop(key, None)
+            broadcast.close(error)
+
+
+_flights = SingleFlight()
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.split()).casefold()
+
+
+def coalesced_retrieve(retriever: Retriever, question: str) -> List[Dict[str, Any]]:
+    if not COALESCE_REQUESTS:
+        return retriever.retrieve(question)
+    key = ("retrieve", normalize_question(question), retriever.index_version, retriever.top_k)
+    contexts = _flights.do(key, lambda: retriever.retrieve(question))
+    return [dict(c) for c in contexts]  # callers may annotate their copy
+
+
+def coalesced_answer(
+    question: str,
+    contexts: List[Dict[str, Any]],
+    mode: str = "online",
+    index_version: str | None = None,
+) -> str:
+    # contexts are a function of (question, index version), so they aren't part of the key
+    if not COALESCE_REQUESTS:
+        return generate_answer(question, contexts, mode=mode)
+    key = ("answer", normalize_question(question), mode, index_version)
+    return _flights.do(key, lambda: generate_answer(question, contexts, mode=mode))
+
+
+def coalesced_stream_answer(
+    question: str,
+    contexts: List[Dict[str, Any]],
+    mode: str = "online",
+    index_version: str | None = None,
+) -> Iterator[str]:
+    if not COALESCE_REQUESTS:
+        return stream_answer(question, contexts, mode=mode)
+    key = ("stream", normalize_question(question), mode, index_version)
+    return _flights.stream(key, lambda: stream_answer(question, contexts, mode=mode))
@@ -1,13 +1,77 @@
 from __future__ import annotations
 
 import json
+import mmap
+import os
+from collections.abc import Sequence
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Tuple
 
 import faiss
 import numpy as np
 
-from .config import FAISS_INDEX_PATH, METADATA_PATH
+from .config import (
+    FAISS_INDEX_PATH,
+    FAISS_MMAP,
+    METADATA_OFFSETS_PATH,
+    METADATA_PATH,
+    QUANTIZATION,
+    QUANTIZED_INDEX_PATH,
+    RESCORE_FACTOR,
+    VECTORS_PATH,
+)
+
+# Newer faiss can map IndexFlat codes straight from the file (zero copy).
+# Older versions only know IO_FLAG_MMAP, which maps IVF lists and reads flat indexes normally.
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def _replace_file(path: Path, write: Callable[[Path], None]) -> None:
+    # Write to a temp file next to `path`, then rename it into place.
+    # Processes that still have the old file mapped keep the old inode
+    # instead of reading a truncated file (which dies with SIGBUS).
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def _save_npy(path: Path, array: np.ndarray) -> None:
+    # np.save(str) would append ".npy" to the temp name
+    with path.open("wb") as f:
+        np.save(f, array)
+
+
+class _MappedMetadata(Sequence):
+    # Read-only view over metadata.json that decodes a record only when it is accessed.
+    # Relies on save() writing one record per line and recording its byte range.
+
+    def __init__(self, metadata_path: Path, offsets_path: Path) -> None:
+        self._file = metadata_path.open("rb")
+        self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = np.load(str(offsets_path), mmap_mode="r")
+        # save() ends the file with the last record followed by "\n]\n". Anything else
+        # means the offsets belong to another build (e.g. loaded mid-save).
+        expected = int(self._offsets[-1][1]) + 3 if len(self._offsets) else len(b"[\n]\n")
+        if len(self._buf) != expected:
+            self.close()
+            raise ValueError("Metadata offsets don't match metadata.json; rebuild the index or load it again.")
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        start, end = self._offsets[i]
+        return json.loads(self._buf[int(start):int(end)].decode("utf-8"))
+
+    def close(self) -> None:
+        self._buf.close()
+        self._file.close()
 
 
 class FaissVectorStore:
@@ -17,11 +81,27 @@ class FaissVectorStore:
         self,
         index_path: Path | None = None,
         metadata_path: Path | None = None,
+        offsets_path: Path | None = None,
+        use_mmap: bool | None = None,
+        quantization: str | None = None,
+        quantized_index_path: Path | None = None,
+        vectors_path: Path | None = None,
     ) -> None:
         self.index_path = index_path or FAISS_INDEX_PATH
         self.metadata_path = metadata_path or METADATA_PATH
+        self.offsets_path = offsets_path or METADATA_OFFSETS_PATH
+        self.use_mmap = FAISS_MMAP if use_mmap is None else use_mmap
+        self.quantization = (quantization or QUANTIZATION).lower()
+        if self.quantization not in ("none", "binary", "int8"):
+            raise ValueError(f"Unknown quantization: {self.quantization}. Use none, binary or int8.")
+        self.quantized_index_path = quantized_index_path or QUANTIZED_INDEX_PATH
+        self.vectors_path = vectors_path or VECTORS_PATH
         self.index: faiss.Index | None = None
-        self.metadata: List[Dict[str, Any]] = []
+        # compressed index + float vectors for rescoring (only when quantization != none)
+        self.quantized_index: faiss.Index | faiss.IndexBinary | None = None
+        self.vectors: np.ndarray | None = None
+        self.metadata: Sequence[Dict[str, Any]] = []
+        self.version: str | None = None  # identifies the loaded index build
 
     def _ensure_dim(self, dim: int) -> None:
         if self.index is None:
@@ -38,40 +118,188 @@ class FaissVectorStore:
         faiss.normalize_L2(x)  # important for IndexFlatIP to work as cosine
         self._ensure_dim(x.shape[1])
         self.index.add(x)
+        self.vectors = x
+        if self.quantization != "none":
+            self.quantized_index = self._build_quantized(x)
         self.metadata = metadatas
         self.save()
 
+    def _build_quantized(self, x: np.ndarray) -> faiss.Index | faiss.IndexBinary:
+        dim = x.shape[1]
+        if self.quantization == "binary":
+            # 1 bit per dimension, searched by hamming distance
+            if dim % 8 != 0:
+                raise ValueError(f"Binary quantization needs a dimension divisible by 8, got {dim}.")
+            index = faiss.IndexBinaryFlat(dim)
+            index.add(np.packbits(x > 0, axis=1))
+            return index
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        index.train(x)  # learns per-dimension ranges
+        index.add(x)
+        return index
+
     def save(self) -> None:
         if self.index is None:
             raise ValueError("Index is not initialized.")
-        faiss.write_index(self.index, str(self.index_path))
-        with self.metadata_path.open("w", encoding="utf-8") as f:
-            json.dump(self.metadata, f, ensure_ascii=False, indent=2)
+        _replace_file(self.index_path, lambda tmp: faiss.write_index(self.index, str(tmp)))
+
+        # Still a plain JSON list, but one record per line so the mmap loader
+        # can jump straight to a record using the saved byte offsets.
+        offsets = np.zeros((len(self.metadata), 2), dtype="int64")
+
+        def write_metadata(tmp: Path) -> None:
+            with tmp.open("wb") as f:
+                f.write(b"[\n")
+                for i, meta in enumerate(self.metadata):
+                    line = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+                    offsets[i] = (f.tell(), f.tell() + len(line))
+                    f.write(line)
+                    f.write(b",\n" if i < len(self.metadata) - 1 else b"\n")
+                f.write(b"]\n")
+
+        _replace_file(self.metadata_path, write_metadata)
+        _replace_file(self.offsets_path, lambda tmp: _save_npy(tmp, offsets))
+
+        if self.quantized_index is None:
+            # leftovers from an earlier quantized build would not match this metadata
+            for path in (self.vectors_path, self.quantized_index_path):
+                if path.exists():
+                    path.unlink()
+            return
+        vectors = np.asarray(self.vectors, dtype="float32")
+        _replace_file(self.vectors_path, lambda tmp: _save_npy(tmp, vectors))
+        if isinstance(self.quantized_index, faiss.IndexBinary):
+            _replace_file(self.quantized_index_path, lambda tmp: faiss.write_index_binary(self.quantized_index, str(tmp)))
+        else:
+            _replace_file(self.quantized_index_path, lambda tmp: faiss.write_index(self.quantized_index, str(tmp)))
 
     def load(self) -> None:
         if not self.index_path.exists() or not self.metadata_path.exists():
             raise FileNotFoundError("Index or metadata not found; please run ingestion first.")
-        self.index = faiss.read_index(str(self.index_path))
-        with self.metadata_path.open("r", encoding="utf-8") as f:
-            self.metadata = json.load(f)
+        self.close()
+
+        if self.quantization != "none":
+            # only the compressed codes live in memory, float vectors stay on disk
+            if not self.quantized_index_path.exists() or not self.vectors_path.exists():
+                raise FileNotFoundError(
+                    f"Quantized index not found; rebuild the index with QUANTIZATION={self.quantization}."
+                )
+            if self.quantization == "binary":
+                self.quantized_index = faiss.read_index_binary(str(self.quantized_index_path))
+            else:
+                self.quantized_index = faiss.read_index(str(self.quantized_index_path))
+            self.vectors = np.load(str(self.vectors_path), mmap_mode="r")
+        elif self.use_mmap:
+            self.index = faiss.read_index(str(self.index_path), _MMAP_FLAGS)
+        else:
+            self.index = faiss.read_index(str(self.index_path))
+
+        stat = self.metadata_path.stat()  # rewritten on every build
+        self.version = f"{stat.st_mtime_ns}-{stat.st_size}"
+
+        # indexes saved before offsets existed can only be loaded the regular way
+        if self.use_mmap and self.offsets_path.exists():
+            self.metadata = _MappedMetadata(self.metadata_path, self.offsets_path)
+        else:
+            with self.metadata_path.open("r", encoding="utf-8") as f:
+                self.metadata = json.load(f)
+
+        # The files are replaced one by one, so a load racing a save can mix builds
+        n = len(self.metadata)
+        if self.index is not None and self.index.ntotal != n:
+            ntotal = self.index.ntotal
+            self.close()
+            raise ValueError(
+                f"FAISS index has {ntotal} vectors but the metadata {n} chunks; "
+                "rebuild the index or load it again."
+            )
+        if self.quantized_index is not None:
+            if self.quantized_index.ntotal != n or len(self.vectors) != n:
+                self.close()
+                raise ValueError(
+                    f"Quantized index doesn't match the metadata ({n} chunks); "
+                    f"rebuild the index with QUANTIZATION={self.quantization}."
+                )
+
+    def close(self) -> None:
+        # release mapped metadata (the faiss index unmaps itself when freed)
+        if isinstance(self.metadata, _MappedMetadata):
+            self.metadata.close()
+        self.metadata = []
+        self.index = None
+        self.quantized_index = None
+        self.vectors = None
+
+    def _search_quantized(self, xq: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Stage 1: wide candidate set from the compressed index.
+        # Stage 2: exact inner product against the float vectors of those candidates only.
+        n_candidates = min(max(top_k * RESCORE_FACTOR, top_k), self.quantized_index.ntotal)
+        if self.quantization == "binary":
+            _, candidates = self.quantized_index.search(np.packbits(xq > 0, axis=1), n_candidates)
+        else:
+            _, candidates = self.quantized_index.search(xq, n_candidates)
+
+        scores = np.full((len(xq), top_k), -np.inf, dtype="float32")
+        indices = np.full((len(xq), top_k), -1, dtype="int64")
+        for qi, cand in enumerate(candidates):
+            cand = np.sort(cand[cand != -1])  # sorted ids -> sequential reads from the mmap
+            if len(cand) == 0:
+                continue
+            cand_scores = np.asarray(self.vectors[cand]) @ xq[qi]
+            order = np.argsort(-cand_scores)[:top_k]
+            scores[qi, : len(order)] = cand_scores[order]
+            indices[qi, : len(order)] = cand[order]
+        return scores, indices
+
+    def search_batch(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 5,
+    ) -> List[List[Tuple[Dict[str, Any], float]]]:
+        if self.index is None and self.quantized_index is None:
+            self.load()
+
+        xq = np.array(query_embeddings, dtype="float32")
+        faiss.normalize_L2(xq)  # normalize query vectors
+        if self.quantized_index is not None:
+            scores, indices = self._search_quantized(xq, top_k)
+        else:
+            scores, indices = self.index.search(xq, top_k)
+
+        all_results: List[List[Tuple[Dict[str, Any], float]]] = []
+        for row_indices, row_scores in zip(indices, scores):
+            results: List[Tuple[Dict[str, Any], float]] = []
+            for idx, score in zip(row_indices, row_scores):
+                if idx == -1:  # faiss returns -1 for missing results
+                    continue
+                meta = self.metadata[int(idx)]
+                results.append((meta, float(score)))
+            all_results.append(results)
+        return all_results
 
     def search(
         self,
         query_embedding: List[float],
         top_k: int = 5,
     ) -> List[Tuple[Dict[str, Any], float]]:
-        if self.index is None:
+        return self.search_batch([query_embedding], top_k=top_k)[0]
+
+    def check_recall(self, n_queries: int = 200, top_k: int = 5, seed: int = 0) -> float:
+        # recall@k of the quantized search against exact search over the float vectors.
+        # Queries are stored vectors plus a bit of noise, so they aren't trivially their own top hit.
+        if self.quantized_index is None:
             self.load()
+        if self.quantized_index is None:
+            raise ValueError("Recall check needs QUANTIZATION=binary or int8.")
 
-        xq = np.array([query_embedding], dtype="float32")
-        faiss.normalize_L2(xq)  # normalize query vector
-        scores, indices = self.index.search(xq, top_k)
-        
-        results: List[Tuple[Dict[str, Any], float]] = []
-        for idx, score in zip(indices[0], scores[0]):
-            if idx == -1:  # faiss returns -1 for missing results
-                continue
-            meta = self.metadata[int(idx)]
-            results.append((meta, float(score)))
-        return results
+        vectors = np.asarray(self.vectors, dtype="float32")
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+        xq = vectors[rows] + rng.normal(scale=0.05, size=(len(rows), vectors.shape[1])).astype("float32")
+        faiss.normalize_L2(xq)
 
+        k = min(top_k, len(vectors))
+        _, exact = faiss.knn(xq, vectors, k, metric=faiss.METRIC_INNER_PRODUCT)
+        _, approx = self._search_quantized(xq, k)
+        hits = sum(len(set(e) & set(a)) for e, a in zip(exact.tolist(), approx.tolist()))
+        return hits / exact.size